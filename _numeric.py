@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Numeric core for the Autoloops detectors.
+
+Pure float arithmetic over the engine's fast-energy history, kept apart
+from the scheduling logic in autoloops.py so it can be compiled.  Every
+window argument is a contiguous float64 view with the oldest sample first.
+"""
+import numpy as np
+
+# Optional: numba compiles the kernels to machine code if available
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):  # type: ignore[no-redef]
+        """Fallback: run the kernels as plain Python."""
+        def wrap(fn):
+            return fn
+        return wrap
+
+
+@njit("float64(float64[::1], int64, int64)", cache=True)
+def _mean(h, lo, hi):
+    s = 0.0
+    for i in range(lo, hi):
+        s += h[i]
+    return s / (hi - lo)
+
+
+@njit("boolean(float64[::1], float64, float64, float64)", cache=True)
+def detect_drop(h, bass_ema, bass_avg, onset_ema):
+    """*h*: newest 16 samples. Build-up, pre-drop dip, then a spike with bass."""
+    buildup     = h[7] > h[0] * 1.08
+    predrop_dip = (h[12] + h[13] + h[14]) / 3 < _mean(h, 0, 12) * 0.85
+    spike       = h[15] > _mean(h, 0, 15) * 1.3
+    bass_ok     = (bass_avg < 0.005) or (bass_ema > bass_avg * 1.5)
+    strong_hit  = onset_ema > 0.8
+    return (buildup and predrop_dip and spike and bass_ok) or \
+           (buildup and spike and strong_hit and bass_ok)
+
+
+@njit("boolean(float64[::1], float64, float64, float64, float64)", cache=True)
+def detect_build(h, ema_fast, high_ema, high_avg, floor):
+    """*h*: newest 12 samples. Sustained rise, helped by rising hi-hats."""
+    slope = (h[11] - h[0]) / 11
+    rising = slope > 0.003 and h[11] > h[0] * 1.12
+    high_up = high_avg > 0.01 and high_ema > high_avg * 1.3
+    return rising and ema_fast > floor and (high_up or slope > 0.006)
+
+
+@njit("float64(float64[::1])", cache=True)
+def slope(h):
+    """Average per-beat change across the window."""
+    return (h[h.shape[0] - 1] - h[0]) / (h.shape[0] - 1)
+
+
+@njit("Tuple((boolean, boolean, float64))(float64[::1], boolean, boolean, "
+      "float64, float64, float64, float64, float64, float64, float64)", cache=True)
+def analyze(h, want_drop, want_build,
+            ema_fast, bass_ema, bass_avg, high_ema, high_avg, onset_ema, sensitivity):
+    """
+    Per-beat drop/build math in one call.
+
+    *h* holds the newest samples (up to 16).  A detector that is not
+    wanted, or whose window is not full yet, reports False; build is
+    skipped when drop fires.  Returns (drop, build, slope), with slope
+    taken over the newest 8 samples.  (Breakdown needs only window sums,
+    which the engine keeps running.)
+    """
+    n = h.shape[0]
+    drop = want_drop and n >= 16 and \
+        detect_drop(h[n - 16:], bass_ema, bass_avg, onset_ema)
+    build = want_build and not drop and n >= 12 and \
+        detect_build(h[n - 12:], ema_fast, high_ema, high_avg, 0.045 / sensitivity)
+    sl = slope(h[n - 8:]) if n >= 8 else 0.0
+    return drop, build, sl
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
-import sys, os, json, asyncio
+import sys, os, json, asyncio, threading
 from dataclasses import dataclass
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
 
 from PyQt6 import QtWidgets, QtGui, QtCore
 from PyQt6.QtCore import Qt
@@ -45,6 +45,11 @@ class BLEWorker(QtCore.QObject):
     def __init__(self):
         super().__init__()
         self.loop = asyncio.new_event_loop()
+        # Newest unsent frame per target set. The GUI thread overwrites,
+        # this worker drains, so a burst of writes to the same lights
+        # collapses to the latest frame instead of queueing up behind BLE.
+        self._pending: Dict[Tuple[str, ...], Tuple[list, bytes]] = {}
+        self._pending_lock = threading.Lock()
 
     @QtCore.pyqtSlot()
     def scan(self):
@@ -62,17 +67,29 @@ class BLEWorker(QtCore.QObject):
                 await ble.multi_write(handles, payload)
         self.loop.run_until_complete(_mw())
 
-    @QtCore.pyqtSlot(list, int, int, int, int)
-    def set_rgb_multi(self, handles_serialized, r, g, b, ww):
-        handles = [ble.LightHandle(**h) for h in handles_serialized]
-        payload = ble.frame_rgb(r, g, b, ww)
-        self._multi_payload(handles, payload)
+    def submit(self, handles_serialized: list, payload: bytes):
+        """Queue *payload* from any thread, replacing an unsent frame for the same targets."""
+        key = tuple(h["address"] for h in handles_serialized)
+        with self._pending_lock:
+            idle = not self._pending
+            self._pending.pop(key, None)   # re-insert last so send order follows the newest writes
+            self._pending[key] = (handles_serialized, payload)
+        if idle:
+            QtCore.QMetaObject.invokeMethod(
+                self, "drain", QtCore.Qt.ConnectionType.QueuedConnection
+            )
 
-    @QtCore.pyqtSlot(list, int, int)
-    def mode_multi(self, handles_serialized, mode, speed):
-        handles = [ble.LightHandle(**h) for h in handles_serialized]
-        payload = ble.frame_mode(mode, speed)
-        self._multi_payload(handles, payload)
+    @QtCore.pyqtSlot()
+    def drain(self):
+        while True:
+            with self._pending_lock:
+                if not self._pending:
+                    return
+                batch = list(self._pending.values())
+                self._pending.clear()
+            for handles_serialized, payload in batch:
+                handles = [ble.LightHandle(**h) for h in handles_serialized]
+                self._multi_payload(handles, payload)
 
 class MainWindow(QWidget):
     def __init__(self):
@@ -549,23 +566,13 @@ class MainWindow(QWidget):
         bscale = self.s_brightness.value() / 100.0
         r = int(r * bscale); g = int(g * bscale); b = int(b * bscale)
         serialized = [t.__dict__ for t in targets]
-        QtCore.QMetaObject.invokeMethod(
-            self.ble_worker, "set_rgb_multi",
-            QtCore.Qt.ConnectionType.QueuedConnection,
-            QtCore.Q_ARG(list, serialized),
-            QtCore.Q_ARG(int, r), QtCore.Q_ARG(int, g), QtCore.Q_ARG(int, b), QtCore.Q_ARG(int, 0)
-        )
+        self.ble_worker.submit(serialized, ble.frame_rgb(r, g, b))
 
     def _set_mode_targets(self, mid, spd):
         targets = self.current_targets()
         if not targets: return
         serialized = [t.__dict__ for t in targets]
-        QtCore.QMetaObject.invokeMethod(
-            self.ble_worker, "mode_multi",
-            QtCore.Qt.ConnectionType.QueuedConnection,
-            QtCore.Q_ARG(list, serialized),
-            QtCore.Q_ARG(int, int(mid)), QtCore.Q_ARG(int, int(spd))
-        )
+        self.ble_worker.submit(serialized, ble.frame_mode(int(mid), int(spd)))
 
     # ---------- A/B independent control (for autoloops split effects) ----------
     def _set_rgb_a(self, r, g, b):
@@ -573,44 +580,24 @@ class MainWindow(QWidget):
         bscale = self.s_brightness.value() / 100.0
         r, g, b = int(r * bscale), int(g * bscale), int(b * bscale)
         serialized = [self.lightA.__dict__]
-        QtCore.QMetaObject.invokeMethod(
-            self.ble_worker, "set_rgb_multi",
-            QtCore.Qt.ConnectionType.QueuedConnection,
-            QtCore.Q_ARG(list, serialized),
-            QtCore.Q_ARG(int, r), QtCore.Q_ARG(int, g), QtCore.Q_ARG(int, b), QtCore.Q_ARG(int, 0)
-        )
+        self.ble_worker.submit(serialized, ble.frame_rgb(r, g, b))
 
     def _set_rgb_b(self, r, g, b):
         if not self.lightB: return
         bscale = self.s_brightness.value() / 100.0
         r, g, b = int(r * bscale), int(g * bscale), int(b * bscale)
         serialized = [self.lightB.__dict__]
-        QtCore.QMetaObject.invokeMethod(
-            self.ble_worker, "set_rgb_multi",
-            QtCore.Qt.ConnectionType.QueuedConnection,
-            QtCore.Q_ARG(list, serialized),
-            QtCore.Q_ARG(int, r), QtCore.Q_ARG(int, g), QtCore.Q_ARG(int, b), QtCore.Q_ARG(int, 0)
-        )
+        self.ble_worker.submit(serialized, ble.frame_rgb(r, g, b))
 
     def _set_mode_a(self, mid, spd):
         if not self.lightA: return
         serialized = [self.lightA.__dict__]
-        QtCore.QMetaObject.invokeMethod(
-            self.ble_worker, "mode_multi",
-            QtCore.Qt.ConnectionType.QueuedConnection,
-            QtCore.Q_ARG(list, serialized),
-            QtCore.Q_ARG(int, int(mid)), QtCore.Q_ARG(int, int(spd))
-        )
+        self.ble_worker.submit(serialized, ble.frame_mode(int(mid), int(spd)))
 
     def _set_mode_b(self, mid, spd):
         if not self.lightB: return
         serialized = [self.lightB.__dict__]
-        QtCore.QMetaObject.invokeMethod(
-            self.ble_worker, "mode_multi",
-            QtCore.Qt.ConnectionType.QueuedConnection,
-            QtCore.Q_ARG(list, serialized),
-            QtCore.Q_ARG(int, int(mid)), QtCore.Q_ARG(int, int(spd))
-        )
+        self.ble_worker.submit(serialized, ble.frame_mode(int(mid), int(spd)))
 
     def _flash_white_ms(self, ms:int):
         if self._flash_active:
@@ -769,7 +756,7 @@ class MainWindow(QWidget):
                 flash_rgb = (255, 255, 255)
 
             if self.autoloops_enabled:
-                tier = self.engine._energy_tier()
+                tier = self.engine._beat_tier
                 if tier == EnergyTier.HIGH:
                     self._flash_color_ms(flash_rgb, 150)
                 elif tier == EnergyTier.MED:
@@ -780,7 +767,7 @@ class MainWindow(QWidget):
                 self._flash_color_ms(flash_rgb, 90)
 
         if self.autoloops_enabled:
-            tier = self.engine._energy_tier()
+            tier = self.engine._beat_tier
             sec = self.engine._section.name
             fx = self.engine._effect.name
             self.lbl_energy.setText(f"{tier.name} | {sec} | {fx} (RMS: {ev.rms:.3f})")
@@ -910,12 +897,7 @@ class MainWindow(QWidget):
         bscale = self.s_brightness.value() / 100.0
         r = int(r * bscale); g = int(g * bscale); b = int(b * bscale)
         serialized = [handle.__dict__]
-        QtCore.QMetaObject.invokeMethod(
-            self.ble_worker, "set_rgb_multi",
-            QtCore.Qt.ConnectionType.QueuedConnection,
-            QtCore.Q_ARG(list, serialized),
-            QtCore.Q_ARG(int, r), QtCore.Q_ARG(int, g), QtCore.Q_ARG(int, b), QtCore.Q_ARG(int, 0)
-        )
+        self.ble_worker.submit(serialized, ble.frame_rgb(r, g, b))
 
     def audio_debug(self):
         """Print 5 seconds of raw audio stats for diagnostics"""
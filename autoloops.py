@@ -7,27 +7,34 @@ A/B-split effects that respond to beat position, onset strength, and
 energy dynamics.  15 distinct effects with style-weighted selection.
 """
 from dataclasses import dataclass
-from typing import List, Tuple, Dict, Optional, Callable
+from typing import List, Tuple, Dict, Optional, Callable, Mapping
+from types import MappingProxyType
 from collections import deque
+from itertools import accumulate
+from bisect import bisect_right
+from functools import lru_cache
 from enum import Enum, auto
 import random
 import time
-from logger import DiagnosticLogger, LogEntry
+import numpy as np
+import _numeric
+from logger import DiagnosticLogger
 
 RGB = Tuple[int, int, int]
 
 # ---------------------------------------------------------------------------
 # Color Palettes
 # ---------------------------------------------------------------------------
-PALETTES: Dict[str, List[RGB]] = {
-    "ND":    [(12, 36, 150), (255, 200, 0), (255, 255, 255)],
-    "Warm":  [(255, 120, 0), (255, 180, 120), (255, 40, 0), (255, 255, 255)],
-    "Cool":  [(0, 180, 255), (0, 255, 150), (0, 80, 255), (255, 255, 255)],
-    "Neon":  [(255, 0, 255), (0, 255, 255), (255, 0, 120), (255, 255, 255)],
-    "Fire":  [(255, 0, 0), (255, 80, 0), (255, 160, 0), (255, 255, 100)],
-    "Ocean": [(0, 30, 180), (0, 120, 255), (0, 200, 200), (150, 220, 255)],
-    "UV":    [(100, 0, 255), (180, 0, 255), (255, 0, 200), (255, 100, 255)],
-}
+# Immutable, so the engine can share them without copying.
+PALETTES: Mapping[str, Tuple[RGB, ...]] = MappingProxyType({
+    "ND":    ((12, 36, 150), (255, 200, 0), (255, 255, 255)),
+    "Warm":  ((255, 120, 0), (255, 180, 120), (255, 40, 0), (255, 255, 255)),
+    "Cool":  ((0, 180, 255), (0, 255, 150), (0, 80, 255), (255, 255, 255)),
+    "Neon":  ((255, 0, 255), (0, 255, 255), (255, 0, 120), (255, 255, 255)),
+    "Fire":  ((255, 0, 0), (255, 80, 0), (255, 160, 0), (255, 255, 100)),
+    "Ocean": ((0, 30, 180), (0, 120, 255), (0, 200, 200), (150, 220, 255)),
+    "UV":    ((100, 0, 255), (180, 0, 255), (255, 0, 200), (255, 100, 255)),
+})
 
 # ---------------------------------------------------------------------------
 # Vendor mode constants
@@ -48,7 +55,7 @@ MODE_PULSE_RAINBOW  = 0x25
 # ---------------------------------------------------------------------------
 # Enums
 # ---------------------------------------------------------------------------
-@dataclass
+@dataclass(slots=True)
 class GridState:
     beat: int = 0
     bar_len: int = 4
@@ -59,6 +66,12 @@ class EnergyTier(Enum):
     MED  = 2
     HIGH = 3
 
+# raw tier indexed by (low << 1 | high); low wins when both thresholds trip
+_RAW_TIERS = (EnergyTier.MED, EnergyTier.HIGH, EnergyTier.LOW, EnergyTier.LOW)
+# plain-dict stand-ins for Enum.value / Enum.name on the per-beat path
+_TIER_LEVEL: Dict[EnergyTier, int] = {t: t.value for t in EnergyTier}
+_TIER_NAMES: Dict[EnergyTier, str] = {t: t.name for t in EnergyTier}
+
 class Section(Enum):
     VERSE     = auto()
     BUILD     = auto()
@@ -101,6 +114,11 @@ class Program(Enum):
     RAINBOW_STROBE = auto()
     BUILD_FLASH    = auto()
 
+# "SECTION/EFFECT" strings for the log's program column, built once
+_PROGRAM_LABELS: Dict[Tuple[Section, Effect], str] = {
+    (s, e): f"{s.name}/{e.name}" for s in Section for e in Effect
+}
+
 PRESET_NAMES = [
     "Beat: White Flash",
     "Beat: Palette Cycle",
@@ -160,6 +178,34 @@ _STYLE_BOOSTS: Dict[str, Dict[Effect, float]] = {
     },
 }
 
+# (effects, cumulative weights) ready for a bisect pick
+_FxTable = Tuple[Tuple[Effect, ...], Tuple[float, ...]]
+
+def _effect_tables(style: str) -> Dict[Section, Dict[Optional[Effect], _FxTable]]:
+    """
+    Style-boosted (effects, cumulative weights) per section, keyed by the
+    effect to leave out so a pick never repeats the running one
+    (None = nothing excluded).
+    """
+    boosts = _STYLE_BOOSTS.get(style, {})
+
+    def table(pairs):
+        return tuple(e for e, _ in pairs), tuple(accumulate(w for _, w in pairs))
+
+    out: Dict[Section, Dict[Optional[Effect], _FxTable]] = {}
+    for section, base in _SECTION_EFFECTS.items():
+        weighted = [(e, w * boosts.get(e, 1.0)) for e, w in base]
+        per: Dict[Optional[Effect], _FxTable] = {None: table(weighted)}
+        for skip, _ in weighted:
+            rest = [(e, w) for e, w in weighted if e != skip]
+            if rest:
+                per[skip] = table(rest)
+        out[section] = per
+    return out
+
+# precomputed once per style; set_style just swaps the active table
+_EFFECT_TABLES = {style: _effect_tables(style) for style in _STYLE_BOOSTS}
+
 # minimum beats in each section before allowing transition out
 _MIN_SECTION_BEATS: Dict[Section, int] = {
     Section.VERSE:     8,
@@ -181,12 +227,18 @@ STYLE_WEIGHTS = {
 # Helper functions
 # ---------------------------------------------------------------------------
 def speed_for_bpm(bpm: float, intensity: float = 1.0) -> int:
+    # 1-BPM buckets: the tracked tempo jitters by fractions of a BPM, and
+    # the vendor speed byte is far coarser than that anyway
+    return _speed_for_bpm(round(bpm), intensity)
+
+@lru_cache(maxsize=256)
+def _speed_for_bpm(bpm: int, intensity: float) -> int:
     if bpm <= 0: return 20
     base = 600.0 / bpm
     s = int(round(base / intensity))
     return max(2, min(100, s))
 
-def nearest_pulse_mode(c: RGB) -> int:
+def _classify_pulse_mode(c: RGB) -> int:
     r, g, b = c
     if r > 220 and g > 220 and b > 220: return MODE_PULSE_WHITE
     if r > 200 and g > 200 and b < 80:  return MODE_PULSE_YELLOW
@@ -196,6 +248,16 @@ def nearest_pulse_mode(c: RGB) -> int:
     if g >= r and g >= b:               return MODE_PULSE_GREEN
     return MODE_PULSE_BLUE
 
+# Exact per-color table: pulse effects only ever ask about palette colors.
+# (A coarse r>>5/g>>5/b>>5 grid would misplace colors sitting on the
+# 200/220 thresholds, e.g. ND's (255, 200, 0) would turn yellow.)
+_PULSE_LUT: Dict[RGB, int] = {
+    c: _classify_pulse_mode(c) for pal in PALETTES.values() for c in pal
+}
+
+def nearest_pulse_mode(c: RGB) -> int:
+    return _PULSE_LUT.get(c) or _classify_pulse_mode(c)
+
 def complement(c: RGB) -> RGB:
     return (255 - c[0], 255 - c[1], 255 - c[2])
 
@@ -211,8 +273,70 @@ def lerp_color(a: RGB, b: RGB, t: float) -> RGB:
         int(a[2] + (b[2] - a[2]) * t),
     )
 
-def mean(xs: List[float]) -> float:
-    return sum(xs) / len(xs) if xs else 0.0
+class _Ring:
+    """
+    Fixed-size float history backed by a mirrored numpy buffer.
+
+    Each sample is stored twice (slot i and i + size), so the newest k
+    samples are always one contiguous view — no copies, no wraparound.
+    A running total makes mean() O(1); it is re-summed exactly each time
+    the write index wraps so rounding error cannot accumulate.  *windows*
+    adds running sums over the newest k samples for each k given, kept
+    the same way (see window_sum()).
+    """
+    __slots__ = ("size", "buf", "i", "n", "total", "windows", "sums")
+
+    def __init__(self, size: int, windows: Tuple[int, ...] = ()):
+        assert all(0 < k <= size for k in windows)
+        self.size = size
+        self.buf = np.zeros(2 * size)
+        self.i = 0      # next write slot
+        self.n = 0      # samples held (<= size)
+        self.total = 0.0
+        self.windows = windows
+        self.sums = [0.0] * len(windows)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def append(self, v: float):
+        i, size, n, buf = self.i, self.size, self.n, self.buf
+        if self.windows:
+            sums = self.sums
+            for j, k in enumerate(self.windows):
+                # the sample k back leaves the window (once there is one)
+                sums[j] += v - float(buf[i + size - k]) if n >= k else v
+        if n == size:
+            self.total -= float(buf[i])   # oldest sample, overwritten below
+        else:
+            self.n = n + 1
+        buf[i] = buf[i + size] = v
+        self.total += v
+        i += 1
+        if i == size:
+            i = 0
+            self.total = float(buf[:size].sum())
+            for j, k in enumerate(self.windows):
+                if self.n >= k:
+                    self.sums[j] = float(buf[size - k:size].sum())
+        self.i = i
+
+    def mean(self) -> float:
+        return self.total / self.n if self.n else 0.0
+
+    def window_sum(self, j: int) -> float:
+        """Sum of the newest windows[j] samples (fewer until that many arrive)."""
+        return self.sums[j]
+
+    def last(self, k: int) -> np.ndarray:
+        """View of the newest *k* samples, oldest first (requires k <= len)."""
+        end = self.i + self.size
+        return self.buf[end - k:end]
+
+    def clear(self):
+        self.i = self.n = 0
+        self.total = 0.0
+        self.sums = [0.0] * len(self.windows)
 
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -229,12 +353,14 @@ class AutoLoopsEngine:
     flash_white(ms)        – flash white on all targets for *ms*
     set_rgb_a / set_rgb_b  – set Light A / B independently (optional)
     set_mode_a / set_mode_b– set vendor mode on A / B independently (optional)
+    seed                   – seed for effect selection (optional)
     """
 
     def __init__(self, set_rgb, set_mode, flash_white, *,
                  set_rgb_a=None, set_rgb_b=None,
                  set_mode_a=None, set_mode_b=None,
-                 base_color: RGB = (255, 255, 255)):
+                 base_color: RGB = (255, 255, 255),
+                 seed: Optional[int] = None):
         # ---- callbacks (all-targets) ----
         self.set_rgb = set_rgb
         self.set_mode = set_mode
@@ -248,9 +374,12 @@ class AutoLoopsEngine:
 
         # ---- grid / style ----
         self.state = GridState()
+        self._sync_grid()
         self.style = "House"
+        self._fx_tables = _EFFECT_TABLES["House"]
+        self._rng = random.Random(seed)   # private stream; pass seed to replay a show
         self.palette_name = "ND"
-        self._pal = list(PALETTES["ND"])
+        self._pal = PALETTES["ND"]
         self._pi = 0           # palette index
         self.base_color = base_color
         self.alt_color: RGB = (12, 36, 150)
@@ -259,12 +388,12 @@ class AutoLoopsEngine:
         self._ema_fast = 0.0
         self._ema_med  = 0.0
         self._ema_long = 0.0
-        self._fast_hist: deque = deque(maxlen=32)
+        self._fast_hist = _Ring(32, windows=(8, 20))   # breakdown: last 8 vs 12 before
         self._bpm_hist: deque  = deque(maxlen=8)
         self._high_ema  = 0.0
         self._bass_ema  = 0.0
-        self._high_hist: deque = deque(maxlen=32)
-        self._bass_hist: deque = deque(maxlen=32)
+        self._high_hist = _Ring(32)
+        self._bass_hist = _Ring(32)
         self._high_avg = 0.0
         self._bass_avg = 0.0
         self._onset_ema = 0.0
@@ -273,6 +402,7 @@ class AutoLoopsEngine:
         self._tier = EnergyTier.LOW
         self._tier_hold = 0
         self._tier_beats = 0   # consecutive beats at this tier
+        self._beat_tier = EnergyTier.LOW   # tier resolved once per beat in on_beat
 
         # ---- section state ----
         self._section = Section.VERSE
@@ -298,6 +428,7 @@ class AutoLoopsEngine:
         self._c_build = False
         self._c_breakdown = False
         self._c_drop = False
+        self._slope = 0.0   # fast-energy slope over the last 8 beats
 
         # ---- logger ----
         self.logger = DiagnosticLogger(enabled=True)
@@ -307,6 +438,7 @@ class AutoLoopsEngine:
     # ===================================================================
     def reset_music_context(self):
         self.state = GridState()
+        self._sync_grid()
         self._ema_fast = self._ema_med = self._ema_long = 0.0
         self._fast_hist.clear(); self._bpm_hist.clear()
         self._high_ema = self._bass_ema = 0.0
@@ -314,23 +446,37 @@ class AutoLoopsEngine:
         self._high_avg = self._bass_avg = 0.0
         self._onset_ema = 0.0
         self._tier = EnergyTier.LOW; self._tier_hold = 0; self._tier_beats = 0
+        self._beat_tier = EnergyTier.LOW
         self._section = Section.VERSE; self._section_beats = 0
         self._effect = Effect.COLOR_WASH; self._fx_beat = 0; self._fx_dur = 16
         self._cooldown = 0; self._in_vendor_mode = False
         self._pi = 0; self._c_build = self._c_breakdown = self._c_drop = False
+        self._slope = 0.0
+
+    def _sync_grid(self):
+        """Cache bit masks for the bar/phrase math in on_beat."""
+        bl, pb = self.state.bar_len, self.state.phrase_bars
+        assert bl & (bl - 1) == 0 and pb & (pb - 1) == 0, \
+            "bar_len and phrase_bars must be powers of two"
+        self._bar_mask = bl - 1
+        self._bar_shift = bl.bit_length() - 1
+        self._phrase_mask = pb - 1
 
     def set_style(self, name: str):
         if name in _STYLE_BOOSTS or name in STYLE_WEIGHTS:
             self.style = name
+            self._fx_tables = _EFFECT_TABLES.get(name) or _effect_tables(name)
 
     def set_palette(self, name: str):
         if name in PALETTES:
             self.palette_name = name
-            self._pal = list(PALETTES[name])
+            self._pal = PALETTES[name]
             self._pi = 0
 
     def set_manual_tier(self, tier: Optional[EnergyTier]):
         self._manual_tier = tier
+        if tier is not None:
+            self._beat_tier = tier  # readers see it before the next beat
 
     def enable_preset(self, name: str):
         self._preset_active = True
@@ -353,22 +499,24 @@ class AutoLoopsEngine:
     #  Energy tracking
     # ===================================================================
     def _update_energy(self, rms: float, high: float, bass: float, onset: float):
-        if self._ema_fast == 0.0:
-            self._ema_fast = self._ema_med = self._ema_long = rms
+        fast = self._ema_fast
+        if fast == 0.0:
+            fast = med = slow = rms
         else:
-            self._ema_fast = 0.55 * self._ema_fast + 0.45 * rms
-            self._ema_med  = 0.90 * self._ema_med  + 0.10 * rms
-            self._ema_long = 0.97 * self._ema_long + 0.03 * rms
-        self._fast_hist.append(self._ema_fast)
+            fast = 0.55 * fast           + 0.45 * rms
+            med  = 0.90 * self._ema_med  + 0.10 * rms
+            slow = 0.97 * self._ema_long + 0.03 * rms
+        self._ema_fast, self._ema_med, self._ema_long = fast, med, slow
+        self._fast_hist.append(fast)
 
         if high > 0:
             self._high_ema = 0.8 * self._high_ema + 0.2 * high
             self._high_hist.append(self._high_ema)
+            self._high_avg = self._high_hist.mean()
         if bass > 0:
             self._bass_ema = 0.8 * self._bass_ema + 0.2 * bass
             self._bass_hist.append(self._bass_ema)
-        self._high_avg = mean(list(self._high_hist)) if self._high_hist else 0.0
-        self._bass_avg = mean(list(self._bass_hist)) if self._bass_hist else 0.0
+            self._bass_avg = self._bass_hist.mean()
         if onset > 0:
             self._onset_ema = 0.7 * self._onset_ema + 0.3 * onset
 
@@ -378,25 +526,20 @@ class AutoLoopsEngine:
     def _energy_tier(self) -> EnergyTier:
         if self._manual_tier is not None:
             return self._manual_tier
-        ratio = (self._ema_fast + 1e-6) / (self._ema_med + 1e-6)
-        s = self._sensitivity_scale
-        lo = 0.045 / s
-        hi = 0.065 / s
-
-        if self._ema_fast < lo or ratio < 0.90:
-            raw = EnergyTier.LOW
-        elif self._ema_fast > hi or ratio > 1.15:
-            raw = EnergyTier.HIGH
-        else:
-            raw = EnergyTier.MED
-
-        # hysteresis
+        # hysteresis: while holding, the raw tier is not needed at all
         if self._tier_hold > 0:
             self._tier_hold -= 1
             return self._tier
 
-        if raw != self._tier:
-            if raw.value > self._tier.value:        # escalation: immediate
+        fast = self._ema_fast
+        ratio = (fast + 1e-6) / (self._ema_med + 1e-6)
+        s = self._sensitivity_scale
+        low  = (fast < 0.045 / s) | (ratio < 0.90)
+        high = (fast > 0.065 / s) | (ratio > 1.15)
+        raw = _RAW_TIERS[low << 1 | high]
+
+        if raw is not self._tier:
+            if _TIER_LEVEL[raw] > _TIER_LEVEL[self._tier]:   # escalation: immediate
                 self._tier = raw
                 self._tier_hold = 2
                 self._tier_beats = 0
@@ -411,79 +554,71 @@ class AutoLoopsEngine:
     # ===================================================================
     #  Musical-structure detectors
     # ===================================================================
-    def _detect_drop(self) -> bool:
-        if len(self._fast_hist) < 16 or self.state.beat < 16:
-            return False
-        h = list(self._fast_hist)[-16:]
-        buildup      = h[7] > h[0] * 1.08
-        predrop_dip  = mean(h[-4:-1]) < mean(h[:-4]) * 0.85
-        spike        = h[-1] > mean(h[:-1]) * 1.3
-        bass_ok      = (self._bass_avg < 0.005) or (self._bass_ema > self._bass_avg * 1.5)
-        strong_hit   = self._onset_ema > 0.8
-        return (buildup and predrop_dip and spike and bass_ok) or \
-               (buildup and spike and strong_hit and bass_ok)
-
-    def _detect_build(self) -> bool:
-        if len(self._fast_hist) < 12:
-            return False
-        h = list(self._fast_hist)[-12:]
-        slope = (h[-1] - h[0]) / 11
-        rising = slope > 0.003 and h[-1] > h[0] * 1.12
-        high_up = (self._high_avg > 0.01 and self._high_ema > self._high_avg * 1.3)
-        floor = self._ema_fast > (0.045 / self._sensitivity_scale)
-        return rising and floor and (high_up or slope > 0.006)
-
-    def _detect_breakdown(self) -> bool:
-        if len(self._fast_hist) < 20:
-            return False
-        prev = mean(list(self._fast_hist)[-20:-8])
-        recent = mean(list(self._fast_hist)[-8:])
-        active = prev > (0.035 / self._sensitivity_scale)
-        return active and recent < prev * 0.55
+    def _run_detectors(self, want_drop: bool, want_build: bool, want_breakdown: bool):
+        """One kernel call per beat: detector flags plus the 8-beat energy slope."""
+        fh = self._fast_hist
+        drop, build, slope = _numeric.analyze(
+            fh.last(min(len(fh), 16)), want_drop, want_build,
+            self._ema_fast, self._bass_ema, self._bass_avg,
+            self._high_ema, self._high_avg, self._onset_ema,
+            float(self._sensitivity_scale))
+        self._c_drop, self._c_build = bool(drop), bool(build)
+        self._slope = slope
+        # Breakdown: the last 8 fall well below the 12 before them, read
+        # straight off the ring's running window sums
+        breakdown = False
+        if want_breakdown and len(fh) >= 20:
+            recent = fh.window_sum(0)
+            prev = (fh.window_sum(1) - recent) / 12
+            breakdown = prev > 0.035 / self._sensitivity_scale and recent / 8 < prev * 0.55
+        self._c_breakdown = breakdown
 
     # ===================================================================
     #  Section state machine
     # ===================================================================
-    def _update_section(self):
-        tier = self._energy_tier()
-        slope = 0.0
-        if len(self._fast_hist) >= 8:
-            r = list(self._fast_hist)[-8:]
-            slope = (r[-1] - r[0]) / 7
-
-        new = self._section
+    # Enum members are bound as keyword-only defaults so the per-beat checks
+    # below are local loads instead of global + attribute lookups.
+    def _update_section(self, tier: EnergyTier, *,
+                        _VERSE=Section.VERSE, _BUILD=Section.BUILD,
+                        _CHORUS=Section.CHORUS, _DROP=Section.DROP,
+                        _BREAKDOWN=Section.BREAKDOWN,
+                        _LOW=EnergyTier.LOW, _HIGH=EnergyTier.HIGH,
+                        _MIN_BEATS=_MIN_SECTION_BEATS):
+        slope = self._slope
+        cur = self._section
+        new = cur
         sb  = self._section_beats
-        mn  = _MIN_SECTION_BEATS.get(self._section, 8)
+        mn  = _MIN_BEATS.get(cur, 8)
 
         # DROP has highest priority (transient event)
-        if self._c_drop and self._cooldown == 0 and self._section != Section.DROP:
-            new = Section.DROP
+        if self._c_drop and self._cooldown == 0 and cur is not _DROP:
+            new = _DROP
 
         # BUILD: rising energy, not already dropping
-        elif self._c_build and self._section not in (Section.DROP,) and tier != EnergyTier.LOW:
-            if self._section != Section.BUILD:
-                new = Section.BUILD
+        elif self._c_build and cur is not _DROP and tier is not _LOW:
+            if cur is not _BUILD:
+                new = _BUILD
 
         # CHORUS: sustained high
-        elif tier == EnergyTier.HIGH and self._tier_beats >= 6:
-            if self._section == Section.DROP and sb < 8:
+        elif tier is _HIGH and self._tier_beats >= 6:
+            if cur is _DROP and sb < 8:
                 pass   # let drop play out
             else:
-                new = Section.CHORUS
+                new = _CHORUS
 
         # BREAKDOWN: coming down from high-energy section
-        elif self._section in (Section.CHORUS, Section.DROP) and sb >= mn:
-            if tier != EnergyTier.HIGH and slope < 0:
-                new = Section.BREAKDOWN
+        elif (cur is _CHORUS or cur is _DROP) and sb >= mn:
+            if tier is not _HIGH and slope < 0:
+                new = _BREAKDOWN
 
         # VERSE: low/med steady state
-        elif tier in (EnergyTier.LOW, EnergyTier.MED) and sb >= mn:
-            if self._section == Section.BREAKDOWN and sb >= 8:
-                new = Section.VERSE
-            elif self._section == Section.BUILD and tier == EnergyTier.LOW:
-                new = Section.VERSE
+        elif tier is not _HIGH and sb >= mn:
+            if cur is _BREAKDOWN and sb >= 8:
+                new = _VERSE
+            elif cur is _BUILD and tier is _LOW:
+                new = _VERSE
 
-        if new != self._section:
+        if new is not cur:
             self._transition_section(new)
         else:
             self._section_beats += 1
@@ -498,19 +633,13 @@ class AutoLoopsEngine:
     #  Effect selection
     # ===================================================================
     def _pick_effect(self, section: Section):
-        base = _SECTION_EFFECTS.get(section, [])
-        if not base:
+        tables = self._fx_tables.get(section)
+        if not tables:
             return
-        boosts = _STYLE_BOOSTS.get(self.style, {})
-
         # avoid repeating the same effect
-        available = [(e, w * boosts.get(e, 1.0)) for e, w in base if e != self._effect]
-        if not available:
-            available = [(e, w * boosts.get(e, 1.0)) for e, w in base]
-
-        effects = [e for e, _ in available]
-        weights = [w for _, w in available]
-        self._effect = random.choices(effects, weights=weights, k=1)[0]
+        effects, cum = tables.get(self._effect) or tables[None]
+        x = self._rng.random() * cum[-1]
+        self._effect = effects[bisect_right(cum, x, 0, len(cum) - 1)]
         self._fx_beat = 0
         self._fx_dur = self._default_duration(section)
         self._pi += 1  # fresh palette colors on effect change
@@ -536,6 +665,11 @@ class AutoLoopsEngine:
         beat = self.state.beat
         eb   = self._fx_beat
         bl   = self.state.bar_len
+        fx   = self._effect
+        # bind device callbacks once; every branch below calls them
+        rgb_a, rgb_b = self._rgb_a, self._rgb_b
+        mode_a, mode_b = self._mode_a, self._mode_b
+        flash = self.flash_white
 
         # Helper: palette color at offset
         def pc(offset: int = 0) -> RGB:
@@ -543,33 +677,33 @@ class AutoLoopsEngine:
 
         # ─── VERSE ────────────────────────────────────────────────────
 
-        if self._effect == Effect.SINGLE_SPOT:
+        if fx == Effect.SINGLE_SPOT:
             c = pc()
             # A on for 2 bars, B off; then swap
             if ((beat - 1) // (bl * 2)) % 2 == 0:
-                self._rgb_a(*c); self._rgb_b(0, 0, 0)
+                rgb_a(*c); rgb_b(0, 0, 0)
             else:
-                self._rgb_a(0, 0, 0); self._rgb_b(*c)
+                rgb_a(0, 0, 0); rgb_b(*c)
             if phrase_boundary:
                 self._pi += 1
 
-        elif self._effect == Effect.COLOR_WASH:
+        elif fx == Effect.COLOR_WASH:
             # A and B interpolate through palette, B trails A by 2 beats
             cycle = 8
             t_a = (eb % cycle) / cycle
             t_b = ((eb - 2) % cycle) / cycle
             c1, c2 = pc(0), pc(1)
-            self._rgb_a(*lerp_color(c1, c2, t_a))
-            self._rgb_b(*lerp_color(c1, c2, t_b))
+            rgb_a(*lerp_color(c1, c2, t_a))
+            rgb_b(*lerp_color(c1, c2, t_b))
             if eb > 0 and eb % cycle == 0:
                 self._pi += 1
 
-        elif self._effect == Effect.SOFT_PULSE:
+        elif fx == Effect.SOFT_PULSE:
             c = pc()
             mode = nearest_pulse_mode(c)
             if not self._in_vendor_mode or is_downbeat:
-                self._mode_a(mode, 80)
-                self._mode_b(mode, 80)
+                mode_a(mode, 80)
+                mode_b(mode, 80)
                 self._in_vendor_mode = True
             if phrase_boundary:
                 self._pi += 1
@@ -577,157 +711,157 @@ class AutoLoopsEngine:
 
         # ─── BUILD ────────────────────────────────────────────────────
 
-        elif self._effect == Effect.AB_CHASE:
+        elif fx == Effect.AB_CHASE:
             progress = min(1.0, eb / max(1, self._fx_dur))
             c = pc()
             bright = dim(c, 0.2 + 0.3 * progress)
             # A and B alternate white flashes — creates motion
             if beat % 2 == 0:
-                self._rgb_a(255, 255, 255)
-                self._rgb_b(*bright)
+                rgb_a(255, 255, 255)
+                rgb_b(*bright)
             else:
-                self._rgb_a(*bright)
-                self._rgb_b(255, 255, 255)
+                rgb_a(*bright)
+                rgb_b(255, 255, 255)
             self._in_vendor_mode = False
             if is_downbeat:
-                self.flash_white(int(60 + 90 * progress))
+                flash(int(60 + 90 * progress))
 
-        elif self._effect == Effect.STROBE_RAMP:
+        elif fx == Effect.STROBE_RAMP:
             progress = min(1.0, eb / max(1, self._fx_dur))
             flash_ms = int(140 - 100 * progress)   # 140 → 40 ms
             c = pc()
             # Flash white + show palette color underneath alternating A/B
-            self.flash_white(flash_ms)
+            flash(flash_ms)
             if beat % 2 == 0:
-                self._rgb_a(*c)
-                self._rgb_b(0, 0, 0)
+                rgb_a(*c)
+                rgb_b(0, 0, 0)
             else:
-                self._rgb_a(0, 0, 0)
-                self._rgb_b(*c)
+                rgb_a(0, 0, 0)
+                rgb_b(*c)
             self._in_vendor_mode = False
 
-        elif self._effect == Effect.COLOR_RISE:
+        elif fx == Effect.COLOR_RISE:
             progress = min(1.0, eb / max(1, self._fx_dur))
             idx = pi + eb // 2  # advance palette every 2 beats
             c = pal[idx % len(pal)]
             # Mix towards white as build progresses
             mixed = lerp_color(dim(c, 0.5), (255, 255, 255), progress * 0.45)
-            self._rgb_a(*mixed)
-            self._rgb_b(*mixed)
+            rgb_a(*mixed)
+            rgb_b(*mixed)
             self._in_vendor_mode = False
             if is_downbeat:
-                self.flash_white(int(50 + 100 * progress))
+                flash(int(50 + 100 * progress))
 
         # ─── CHORUS ───────────────────────────────────────────────────
 
-        elif self._effect == Effect.AB_ALTERNATE:
+        elif fx == Effect.AB_ALTERNATE:
             c1, c2 = pc(0), pc(1)
             if beat % 2 == 0:
-                self._rgb_a(*c1); self._rgb_b(*c2)
+                rgb_a(*c1); rgb_b(*c2)
             else:
-                self._rgb_a(*c2); self._rgb_b(*c1)
+                rgb_a(*c2); rgb_b(*c1)
             self._in_vendor_mode = False
             # punchy white on strong downbeats
             if is_downbeat and onset > 0.6:
-                self.flash_white(80)
+                flash(80)
             # rotate colors every 8 beats
             if eb > 0 and eb % 8 == 0:
                 self._pi += 1
 
-        elif self._effect == Effect.AB_COMPLEMENT:
+        elif fx == Effect.AB_COMPLEMENT:
             c = pc()
             comp = complement(c)
             bar_half = (beat // bl) % 2
             if bar_half == 0:
-                self._rgb_a(*c); self._rgb_b(*comp)
+                rgb_a(*c); rgb_b(*comp)
             else:
-                self._rgb_a(*comp); self._rgb_b(*c)
+                rgb_a(*comp); rgb_b(*c)
             self._in_vendor_mode = False
             if phrase_boundary:
                 self._pi += 1
-                self.flash_white(120)
+                flash(120)
 
-        elif self._effect == Effect.BEAT_CYCLE:
+        elif fx == Effect.BEAT_CYCLE:
             c_a = pal[(pi + eb) % len(pal)]
             c_b = pal[(pi + eb + 2) % len(pal)]
-            self._rgb_a(*c_a)
-            self._rgb_b(*c_b)
+            rgb_a(*c_a)
+            rgb_b(*c_b)
             self._in_vendor_mode = False
             if is_downbeat and onset > 0.7:
-                self.flash_white(70)
+                flash(70)
 
-        elif self._effect == Effect.DOWNBEAT_BLAST:
+        elif fx == Effect.DOWNBEAT_BLAST:
             c1, c2 = pc(0), pc(1)
             if bar_pos == 0:
                 # THE ONE — both blast white
-                self._rgb_a(255, 255, 255)
-                self._rgb_b(255, 255, 255)
+                rgb_a(255, 255, 255)
+                rgb_b(255, 255, 255)
             elif bar_pos == 1:
-                self._rgb_a(*c1); self._rgb_b(0, 0, 0)
+                rgb_a(*c1); rgb_b(0, 0, 0)
             elif bar_pos == 2:
-                self._rgb_a(*c1); self._rgb_b(*c2)
+                rgb_a(*c1); rgb_b(*c2)
             else:
-                self._rgb_a(0, 0, 0); self._rgb_b(*c2)
+                rgb_a(0, 0, 0); rgb_b(*c2)
             self._in_vendor_mode = False
             if phrase_boundary:
                 self._pi += 1
 
-        elif self._effect == Effect.STROBE_SPLIT:
+        elif fx == Effect.STROBE_SPLIT:
             c = pc()
             bar_half = (beat // bl) % 2
             if bar_half == 0:
                 # A strobes, B holds solid color
-                self._mode_a(MODE_STROBE_WHITE, speed_for_bpm(bpm, 1.2))
-                self._rgb_b(*c)
+                mode_a(MODE_STROBE_WHITE, speed_for_bpm(bpm, 1.2))
+                rgb_b(*c)
             else:
                 # swap
-                self._rgb_a(*c)
-                self._mode_b(MODE_STROBE_WHITE, speed_for_bpm(bpm, 1.2))
+                rgb_a(*c)
+                mode_b(MODE_STROBE_WHITE, speed_for_bpm(bpm, 1.2))
             self._in_vendor_mode = True
             if phrase_boundary:
                 self._pi += 1
 
         # ─── DROP ─────────────────────────────────────────────────────
 
-        elif self._effect == Effect.BLACKOUT_BLAST:
+        elif fx == Effect.BLACKOUT_BLAST:
             if eb < 2:
                 # total blackout — tension!
-                self._rgb_a(0, 0, 0); self._rgb_b(0, 0, 0)
+                rgb_a(0, 0, 0); rgb_b(0, 0, 0)
                 self._in_vendor_mode = False
             elif eb == 2:
                 # THE DROP — blast
                 self.set_mode(MODE_STROBE_RAINBOW, speed_for_bpm(bpm, 1.8))
-                self.flash_white(250)
+                flash(250)
                 self._in_vendor_mode = True
             else:
                 # sustain strobe, re-assert
                 self.set_mode(MODE_STROBE_RAINBOW, speed_for_bpm(bpm, 1.5))
 
-        elif self._effect == Effect.DROP_STROBE:
+        elif fx == Effect.DROP_STROBE:
             self.set_mode(MODE_STROBE_RAINBOW, speed_for_bpm(bpm, 1.5))
             self._in_vendor_mode = True
             if eb == 0:
-                self.flash_white(200)
+                flash(200)
             elif beat % 4 == 0:
-                self.flash_white(120)
+                flash(120)
 
         # ─── BREAKDOWN ────────────────────────────────────────────────
 
-        elif self._effect == Effect.SLOW_BREATHE:
+        elif fx == Effect.SLOW_BREATHE:
             c = pc()
             mode = nearest_pulse_mode(c)
             if not self._in_vendor_mode or is_downbeat:
-                self._mode_a(mode, 95)
-                self._mode_b(mode, 95)
+                mode_a(mode, 95)
+                mode_b(mode, 95)
                 self._in_vendor_mode = True
             if phrase_boundary:
                 self._pi += 1
                 self._in_vendor_mode = False
 
-        elif self._effect == Effect.FADE_WALK:
+        elif fx == Effect.FADE_WALK:
             c = pal[(pi + eb // 4) % len(pal)]
-            self._rgb_a(*c)
-            self._rgb_b(*dim(c, 0.5))  # B dimmer for depth
+            rgb_a(*c)
+            rgb_b(*dim(c, 0.5))  # B dimmer for depth
             self._in_vendor_mode = False
 
         # ─── advance ──────────────────────────────────────────────────
@@ -785,31 +919,44 @@ class AutoLoopsEngine:
     def on_beat(self, bpm: float, rms: float, high: float = 0.0,
                 bass: float = 0.0, onset_strength: float = 0.0):
         # ---- grid tick ----
-        self.state.beat += 1
-        bar_pos = (self.state.beat - 1) % self.state.bar_len
+        grid = self.state
+        beat = grid.beat = grid.beat + 1
+        bar_pos = (beat - 1) & self._bar_mask
         is_downbeat = (bar_pos == 0)
-        bar_index = (self.state.beat - 1) // self.state.bar_len
-        phrase = (bar_index % self.state.phrase_bars == 0) and is_downbeat and self.state.beat > 1
+        bar_index = (beat - 1) >> self._bar_shift
+        phrase = is_downbeat and beat > 1 and (bar_index & self._phrase_mask) == 0
 
-        # ---- energy / detection ----
-        self._update_energy(rms, high, bass, onset_strength)
         if bpm > 0:
             self._bpm_hist.append(bpm)
         if self._cooldown > 0:
             self._cooldown -= 1
 
-        self._c_drop      = self._detect_drop()
-        self._c_build     = self._detect_build()
-        self._c_breakdown = self._detect_breakdown()
-
         # ---- preset override ----
+        # Presets ignore the energy model, so skip it entirely: EMAs,
+        # histories, tier and detectors stay where they were when the
+        # preset started (the tier the app reads for flash length too)
+        # and pick up from there once it is disabled.
         if self._preset_active and self._preset_name:
+            self._c_drop = self._c_build = self._c_breakdown = False
             self._run_preset(self._preset_name, bpm, is_downbeat)
             self._log(bpm, rms, bass, high, bar_pos, phrase)
             return
 
+        # ---- energy / detection ----
+        self._update_energy(rms, high, bass, onset_strength)
+        # resolve once: _energy_tier() advances the hysteresis counters
+        tier = self._beat_tier = self._energy_tier()
+
+        # Only scan a detector when its result can drive the section machine:
+        # drop is ignored during cooldown / an active DROP, build loses to drop
+        # and never interrupts a DROP, breakdown only feeds the diagnostic log.
+        not_dropping = self._section != Section.DROP
+        self._run_detectors(want_drop=(not_dropping and self._cooldown == 0 and beat >= 16),
+                            want_build=not_dropping,
+                            want_breakdown=self.logger.enabled)
+
         # ---- section update (may change effect) ----
-        self._update_section()
+        self._update_section(tier)
 
         # ---- phrase accent ----
         if phrase:
@@ -825,22 +972,10 @@ class AutoLoopsEngine:
     #  Logging
     # ===================================================================
     def _log(self, bpm, rms, bass, high, bar_pos, phrase):
-        self.logger.log(LogEntry(
-            timestamp=time.time(),
-            beat_num=self.state.beat,
-            bpm=bpm,
-            rms=rms,
-            bass=bass,
-            mid=0.0,
-            high=high,
-            ema_fast=self._ema_fast,
-            ema_med=self._ema_med,
-            ema_long=self._ema_long,
-            energy_tier=self._energy_tier().name,
-            program=f"{self._section.name}/{self._effect.name}",
-            bar_pos=bar_pos,
-            phrase_boundary=phrase,
-            drop_detected=self._c_drop,
-            build_detected=self._c_build,
-            breakdown_detected=self._c_breakdown,
-        ))
+        # positional, in logger.LOG_FIELDS order
+        self.logger.record(
+            time.time(), self.state.beat, bpm, rms, bass, 0.0, high,
+            self._ema_fast, self._ema_med, self._ema_long,
+            _TIER_NAMES[self._beat_tier], _PROGRAM_LABELS[self._section, self._effect],
+            bar_pos, phrase, self._c_drop, self._c_build, self._c_breakdown,
+        )
@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 import asyncio
+import json
+import os
 from dataclasses import dataclass
-from typing import Optional, List, Dict
+from functools import lru_cache
+from typing import Optional, List, Dict, Tuple
 from bleak import BleakScanner, BleakClient, BleakError
 
 # Names we consider "likely LED controllers"
@@ -25,6 +28,9 @@ class LightHandle:
 # ---------------------------
 # Packet builders (FFE9 / 0x56-AA family)
 # ---------------------------
+# Frames are immutable bytes, so repeats (palette colors, the strobe mode
+# re-sent every beat) come from the cache instead of a fresh allocation.
+@lru_cache(maxsize=4096)
 def frame_rgb(r: int, g: int, b: int, ww: int = 0x00) -> bytes:
     """Static RGB (W ignored): 56 R G B W F0 AA"""
     return bytes([0x56, r & 0xFF, g & 0xFF, b & 0xFF, ww & 0xFF, 0xF0, 0xAA])
@@ -33,6 +39,7 @@ def frame_power(on: bool) -> bytes:
     # CC 23 33 = on, CC 24 33 = off
     return bytes([0xCC, 0x23 if on else 0x24, 0x33])
 
+@lru_cache(maxsize=4096)
 def frame_mode(mode: int, speed: int) -> bytes:
     # BB <mode> <speed> 44   (smaller = faster)
     return bytes([0xBB, mode & 0xFF, speed & 0xFF, 0x44])
@@ -88,12 +95,56 @@ async def _probe_family(client: BleakClient, char_uuid: str) -> Optional[str]:
     except Exception:
         return None
 
+# ---------------------------
+# Identify cache: {address: [char_uuid, family]}
+# ---------------------------
+CACHE_PATH = os.path.expanduser("~/.lightdesk_cache.json")
+
+def _load_cache() -> Dict[str, List[str]]:
+    if os.path.exists(CACHE_PATH):
+        try:
+            with open(CACHE_PATH, "r") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+    return {}
+
+def _save_cache(cache: Dict[str, List[str]]):
+    try:
+        with open(CACHE_PATH, "w") as f:
+            json.dump(cache, f, indent=2)
+    except Exception:
+        pass
+
+def _remember(address: str, char_uuid: str, family: str):
+    cache = _load_cache()
+    cache[address] = [char_uuid, family]
+    _save_cache(cache)
+
+def _forget(address: str):
+    """Drop a light from the identify cache so the next connect rediscovers it"""
+    cache = _load_cache()
+    if cache.pop(address, None) is not None:
+        _save_cache(cache)
+
 async def connect_and_identify(light: LightInfo, timeout: float = 8.0) -> LightHandle:
+    # Known light: connect and wake it, skipping GATT discovery and the
+    # family probe. If that fails the entry is stale (or the light is
+    # gone), so forget it and identify from scratch.
+    hit = _load_cache().get(light.address)
+    if hit:
+        try:
+            async with BleakClient(light.address, timeout=timeout) as c:
+                await c.write_gatt_char(hit[0], frame_power(True), response=False)
+            return LightHandle(light.address, light.name, hit[0], hit[1])
+        except Exception:
+            _forget(light.address)
     async with BleakClient(light.address, timeout=timeout) as c:
         char_uuid = await _find_write_char(c)
         fam = await _probe_family(c, char_uuid)
         if fam is None:
             fam = "FFE9_56AA"  # default to HappyLighting-style
+        _remember(light.address, char_uuid, fam)
         # Power on (wake) - try for both FFE9 and FFF3; FFF3 may ignore if unsupported
         try:
             await c.write_gatt_char(char_uuid, frame_power(True), response=False)
@@ -114,9 +165,24 @@ async def multi_write(handles: List[LightHandle], payload: bytes):
 # Low-latency persistent pool
 # ---------------------------
 class _ClientPool:
+    """
+    Persistent connections, one in-flight write per light.
+
+    Writes are newest-wins per light: while a write is on the air, later
+    payloads for the same light only replace the pending one, so a mode
+    change supersedes a static RGB frame that has not been sent yet and a
+    slow link never builds a backlog of stale frames.
+
+    A payload equal to the last one sent to that light is skipped (the
+    controller already shows it) unless ``force=True``; reconnecting
+    forgets the last payload, since the controller may have reset.
+    """
     def __init__(self):
         self._clients: Dict[str, BleakClient] = {}
         self._locks: Dict[str, asyncio.Lock] = {}
+        self._pending: Dict[str, Tuple[bytes, bool]] = {}  # newest unsent (payload, force) per address
+        self._last: Dict[str, bytes] = {}      # last payload sent per address
+        self._chars: Dict[str, str] = {}       # write char rediscovered per address
 
     async def _get_client(self, h: LightHandle) -> BleakClient:
         cli = self._clients.get(h.address)
@@ -125,6 +191,7 @@ class _ClientPool:
             self._clients[h.address] = cli
             self._locks[h.address] = asyncio.Lock()
         if not cli.is_connected:
+            self._last.pop(h.address, None)
             await cli.connect()
             # Power on (wake) - try for both FFE9 and FFF3; FFF3 may ignore if unsupported
             try:
@@ -133,20 +200,43 @@ class _ClientPool:
                 pass
         return cli
 
-    async def write(self, h: LightHandle, payload: bytes):
+    async def write(self, h: LightHandle, payload: bytes, force: bool = False):
+        addr = h.address
+        char = self._chars.get(addr)
+        if char is not None:
+            h.char_uuid = char  # callers may pass handles rebuilt from the stale UUID
+        self._pending[addr] = (payload, force)
         cli = await self._get_client(h)
-        lock = self._locks[h.address]
+        lock = self._locks[addr]
+        if lock.locked():
+            return  # the in-flight writer sends the newest pending payload next
         async with lock:
+            while addr in self._pending:
+                data, forced = self._pending.pop(addr)
+                if not forced and data == self._last.get(addr):
+                    continue
+                await self._send(cli, h, data)
+                self._last[addr] = data
+
+    async def _send(self, cli: BleakClient, h: LightHandle, payload: bytes):
+        try:
+            await cli.write_gatt_char(h.char_uuid, payload, response=False)
+        except (BleakError, Exception):
+            # try one reconnect
+            self._last.pop(h.address, None)
+            try:
+                if cli.is_connected:
+                    await cli.disconnect()
+            except Exception:
+                pass
+            await cli.connect()
             try:
                 await cli.write_gatt_char(h.char_uuid, payload, response=False)
             except (BleakError, Exception):
-                # try one reconnect
-                try:
-                    if cli.is_connected:
-                        await cli.disconnect()
-                except Exception:
-                    pass
-                await cli.connect()
+                # the cached characteristic is stale: rediscover it for this
+                # light (pool and identify cache)
+                h.char_uuid = self._chars[h.address] = await _find_write_char(cli)
+                _remember(h.address, h.char_uuid, h.family)
                 await cli.write_gatt_char(h.char_uuid, payload, response=False)
 
     async def close_all(self):
@@ -158,9 +248,12 @@ class _ClientPool:
             await asyncio.gather(*tasks, return_exceptions=True)
         self._clients.clear()
         self._locks.clear()
+        self._pending.clear()
+        self._last.clear()
+        self._chars.clear()
 
 _pool = _ClientPool()
 
-async def multi_write_fast(handles: List[LightHandle], payload: bytes):
+async def multi_write_fast(handles: List[LightHandle], payload: bytes, force: bool = False):
     """Reuse connections for much lower latency; good for live color wheel."""
-    await asyncio.gather(*(_pool.write(h, payload) for h in handles))
+    await asyncio.gather(*(_pool.write(h, payload, force) for h in handles))
@@ -10,10 +10,13 @@ When to update:
 - When debugging drop/build/breakdown detection
 - When tuning thresholds or parameters
 """
-import csv
+import atexit
+import os
+import queue
+import threading
 import time
 from pathlib import Path
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, fields
 from typing import Optional
 
 @dataclass
@@ -32,40 +35,104 @@ class LogEntry:
     program: str
     bar_pos: int
     phrase_boundary: bool
+    # Detector flags are computed once per beat, before the section update,
+    # and read False when the detector was skipped (it could not fire).
     drop_detected: bool
     build_detected: bool
     breakdown_detected: bool
 
+LOG_FIELDS = tuple(f.name for f in fields(LogEntry))
+
+# One CSV row, fields in LOG_FIELDS order. Every field is a number, a bool
+# or an enum-name label, so nothing ever needs csv quoting.
+LOG_ROW = (
+    "{0:.6f},{1},{2:.2f},{3:.6f},{4:.6f},{5:.6f},{6:.6f},"
+    "{7:.6f},{8:.6f},{9:.6f},{10},{11},{12},{13},{14},{15},{16}\n"
+)
+
+FILE_BUFFER = 65536 # bytes buffered before the OS sees a write (~500 rows)
+QUEUE_MAX = 1024    # rows waiting for the writer thread before we drop
+BATCH = 64          # rows formatted per file write()
+
 class DiagnosticLogger:
     """
     CSV logger that writes beat-by-beat diagnostics for post-analysis.
     Creates timestamped files in user's home directory.
+    Disk writes happen on a background thread; rows it cannot take (it is
+    QUEUE_MAX rows behind, or a write failed) are counted in `dropped`.
     """
     def __init__(self, enabled: bool = True):
         self.enabled = enabled
         self.file = None
-        self.writer = None
+        self._q: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=QUEUE_MAX)
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0
+        self.write_error: Optional[Exception] = None
         if enabled:
             timestamp = time.strftime("%Y%m%d_%H%M%S")
             filename = Path.home() / f"lightdesk_log_{timestamp}.csv"
-            self.file = open(filename, 'w', newline='')
-            self.writer = csv.DictWriter(self.file, fieldnames=[
-                'timestamp', 'beat_num', 'bpm', 'rms', 'bass', 'mid', 'high',
-                'ema_fast', 'ema_med', 'ema_long', 'energy_tier', 'program',
-                'bar_pos', 'phrase_boundary', 'drop_detected', 'build_detected', 'breakdown_detected'
-            ])
-            self.writer.writeheader()
+            self.file = open(filename, 'w', newline='', buffering=FILE_BUFFER)
+            self.file.write(",".join(LOG_FIELDS) + "\n")
+            self._thread = threading.Thread(
+                target=self._write_loop, name="DiagnosticLogger", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.close)  # flush the unflushed tail on exit
             print(f"📊 Diagnostic logging enabled: {filename}")
     
+    def record(self, *values):
+        """Log one beat given positionally in LOG_FIELDS order (no per-beat objects)"""
+        if self.enabled and self.file:
+            try:
+                self._q.put_nowait(values)
+            except queue.Full:
+                self.dropped += 1  # never block the beat on disk
+
+    def _write_loop(self):
+        """Writer thread: drain the queue in batches until the None sentinel"""
+        q, write, row = self._q, self.file.write, LOG_ROW.format
+        while True:
+            batch = [q.get()]
+            while len(batch) < BATCH:
+                try:
+                    batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            done = batch[-1] is None
+            if done:
+                batch.pop()
+            try:
+                write("".join([row(*values) for values in batch]))
+            except (OSError, ValueError) as e:  # disk full, file gone/closed
+                # keep draining so record() and close() never block on us
+                if not self.write_error:
+                    print(f"📊 Diagnostic log write failed, dropping rows: {e}")
+                self.write_error = e
+                self.dropped += len(batch)
+            if done:
+                return
+
     def log(self, entry: LogEntry):
         """Write a single beat's data to CSV"""
-        if self.enabled and self.writer:
-            self.writer.writerow(asdict(entry))
-            self.file.flush()  # Write immediately for real-time monitoring
-    
+        self.record(*(getattr(entry, f) for f in LOG_FIELDS))
+
     def close(self):
-        """Clean shutdown - close file handle"""
+        """Clean shutdown - drain the writer thread, close file handle"""
         if self.file:
-            self.file.close()
+            if self._thread is not None:
+                if self._thread.is_alive():
+                    try:
+                        self._q.put(None, timeout=2.0)
+                    except queue.Full:
+                        pass
+                    self._thread.join(timeout=2.0)
+                self._thread = None
+            try:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
             print("📊 Diagnostic log closed")
 
@@ -11,9 +11,36 @@
 # - Built-in modes: BB <mode> <speed> 44
 #       Static "stop animations" code: 0x25
 #       White strobe: 0x37 (smaller speed = faster)
-
-import asyncio, argparse, sys
-from bleak import BleakScanner, BleakClient, BleakError
+#
+# Fully annotated so the per-frame helpers can be compiled ahead of time:
+#   pip install mypy && mypyc --ignore-missing-imports qhm.py
+# builds a qhm extension next to this file. `python qhm.py ...` always runs
+# this source as __main__, so start the compiled one through an import
+# (from this directory):
+#   python -c 'import qhm; qhm.main()' rgb 255 0 0
+# Delete the .so to go back to the source.
+
+from __future__ import annotations
+
+import asyncio, argparse, json, os, shlex, socket, sys, tempfile, types
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Sequence
+
+if TYPE_CHECKING:
+    from bleak import BleakClient
+    from bleak.backends.device import BLEDevice
+
+def _bleak() -> types.ModuleType:
+    # bleak loads the platform BLE stack on import, which --help and
+    # argument errors never need, so import it on first use
+    import bleak
+    return bleak
+
+# Optional: uvloop cuts per-await overhead for streamed writes (POSIX only)
+try:
+    import uvloop
+    HAVE_UVLOOP = sys.platform != "win32"
+except ImportError:
+    HAVE_UVLOOP = False
 
 # Device names commonly used by these controllers
 NAMES = ("QHM-SDA0", "QHM-S281", "Triones", "Dream", "Light", "Flash")
@@ -35,26 +62,34 @@ def pkt_white(w: int) -> bytes:
     # 56 00 00 00 W 0x0F AA → W only, RGB ignored (matches HappyLighting behavior)
     return bytes([0x56, 0x00, 0x00, 0x00, w & 0xFF, 0x0F, 0xAA])
 
-def apply_order(r, g, b, order="RGB"):
-    order = order.upper()
-    if order == "RGB": return (r, g, b)
-    if order == "GRB": return (g, r, b)
-    if order == "BRG": return (b, r, g)
-    if order == "BGR": return (b, g, r)
-    if order == "RBG": return (r, b, g)
-    if order == "GBR": return (g, b, r)
-    raise ValueError("order must be one of RGB, GRB, BRG, BGR, RBG, GBR")
-
-def parse_hex(h: str, order="RGB"):
+# Channel order → indexes into (r, g, b)
+_ORDERS = {
+    "RGB": (0, 1, 2), "GRB": (1, 0, 2), "BRG": (2, 0, 1),
+    "BGR": (2, 1, 0), "RBG": (0, 2, 1), "GBR": (1, 2, 0),
+}
+
+RGB = tuple[int, int, int]
+
+def order_perm(order: str = "RGB") -> RGB:
+    try:
+        return _ORDERS[order] if order in _ORDERS else _ORDERS[order.upper()]
+    except KeyError:
+        raise ValueError("order must be one of RGB, GRB, BRG, BGR, RBG, GBR") from None
+
+def apply_order(r: int, g: int, b: int, order: str = "RGB") -> RGB:
+    i, j, k = order_perm(order)
+    v = (r, g, b)
+    return (v[i], v[j], v[k])
+
+def parse_hex(h: str, order: str = "RGB") -> RGB:
     h = h.strip().lstrip("#")
     if len(h) != 6:
         raise ValueError("HEX must be 6 chars like FF7F00")
-    r, g, b = int(h[0:2], 16), int(h[2:4], 16), int(h[4:6], 16)
-    m = dict(R=r, G=g, B=b)
-    return (m[order[0]], m[order[1]], m[order[2]])
+    v = int(h, 16)
+    return apply_order((v >> 16) & 0xFF, (v >> 8) & 0xFF, v & 0xFF, order)
 
 # Optional: apply sRGB → linear gamma to make mid-levels look less neon
-def srgb_to_linear_byte(x: int) -> int:
+def _srgb_to_linear(x: int) -> int:
     t = x / 255.0
     if t <= 0.04045:
         u = t / 12.92
@@ -62,103 +97,374 @@ def srgb_to_linear_byte(x: int) -> int:
         u = ((t + 0.055) / 1.055) ** 2.4
     return max(0, min(255, int(round(u * 255))))
 
-async def find_device(target_addr: str | None):
+# Only 256 possible inputs, so compute them all once
+_SRGB_LUT = bytes(_srgb_to_linear(i) for i in range(256))
+
+def srgb_to_linear_byte(x: int) -> int:
+    return _SRGB_LUT[x & 0xFF]
+
+# Resolved devices from earlier runs, so --addr can skip scanning
+CACHE_PATH = os.path.expanduser("~/.cache/qhm/addr.json")
+
+def _load_cache() -> dict[str, Any]:
+    try:
+        with open(CACHE_PATH) as f:
+            cache: dict[str, Any] = json.load(f)
+            return cache
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache(cache: dict[str, Any]) -> None:
+    try:
+        os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+        with open(CACHE_PATH, "w") as f:
+            json.dump(cache, f, indent=2)
+    except OSError:
+        pass
+
+def remember_device(dev: BLEDevice) -> None:
+    # Only BlueZ details (a D-Bus object path) survive a restart; other
+    # backends hold live OS objects, so they just scan by address each run.
+    det = dev.details
+    if not (isinstance(det, dict) and "path" in det):
+        return
+    props = det.get("props") or {}
+    cache = _load_cache()
+    cache[dev.address] = {
+        "name": dev.name,
+        "details": {"path": det["path"],
+                    "props": {k: props[k] for k in ("Adapter", "Address") if k in props}},
+    }
+    _save_cache(cache)
+
+def forget_device(addr: str) -> None:
+    cache = _load_cache()
+    if cache.pop(addr, None) is not None:
+        _save_cache(cache)
+
+def cached_device(addr: str) -> BLEDevice | None:
+    hit = _load_cache().get(addr)
+    if not hit:
+        return None
+    dev: BLEDevice = _bleak().BLEDevice(addr, hit["name"], hit["details"], -127)
+    return dev
+
+def load_seq(path: str, order: str = "RGB", gamma: bool = False) -> list[list[int]]:
+    # One 6-hex color per line ("#" prefix and blank lines allowed).
+    # Order and gamma are applied to the whole sequence at once in numpy.
+    import numpy as np
+    with open(path) as f:
+        hexes = [ln.strip().lstrip("#") for ln in f]
+    hexes = [h for h in hexes if h]
+    if any(len(h) != 6 for h in hexes):
+        raise ValueError("every line must be a 6-hex color like FF7F00")
+    arr = np.frombuffer(bytes.fromhex("".join(hexes)), dtype=np.uint8).reshape(-1, 3)
+    arr = arr[:, list(order_perm(order))]
+    if gamma:
+        arr = np.frombuffer(_SRGB_LUT, dtype=np.uint8)[arr]
+    rows: list[list[int]] = arr.tolist()
+    return rows
+
+async def find_device(target_addr: str | None) -> tuple[str | BLEDevice, str]:
+    # Returns a BLEDevice when one is known, so BleakClient need not scan
+    # again to resolve the address; a bare address string otherwise.
     if target_addr:
-        return target_addr, f"(manual) {target_addr}"
-    devs = await BleakScanner.discover(timeout=6.0)
-    pick = next((d for d in devs if (d.name or "").startswith(NAMES)), None)
+        dev = cached_device(target_addr)
+        if dev is None:
+            dev = await _bleak().BleakScanner.find_device_by_address(target_addr, timeout=3.0)
+            if dev is None:
+                return target_addr, f"(manual) {target_addr}"
+            remember_device(dev)
+        return dev, f"(manual) {target_addr}"
+    # Stops scanning at the first matching advertisement instead of
+    # always waiting out the full timeout
+    pick = await _bleak().BleakScanner.find_device_by_filter(
+        lambda d, adv: (d.name or adv.local_name or "").startswith(NAMES), timeout=6.0
+    )
     if not pick:
         raise SystemExit("No QHM/HappyLighting device advertising (or it’s busy). "
                          "Power-cycle it and ensure the phone app is closed.")
-    return pick.address, f"{pick.name}  {pick.address}"
+    return pick, f"{pick.name}  {pick.address}"
 
-async def write(c: BleakClient, data: bytes, require_response: bool = True):
-    try:
-        await c.write_gatt_char(CHAR_TX, data, response=require_response)
-    except BleakError:
-        if require_response:
-            # Some firmwares only accept write-without-response
-            await c.write_gatt_char(CHAR_TX, data, response=False)
-        else:
-            raise
+async def write(c: BleakClient, data: bytes | bytearray, require_response: bool = False) -> None:
+    # Default is write-without-response: these controllers send no useful
+    # ACK, and waiting for one costs a connection interval per packet.
+    # QHM picks the write type once on connect, so no fallback here.
+    await c.write_gatt_char(CHAR_TX, data, response=require_response)
 
 class QHM:
-    def __init__(self, addr: str):
+    def __init__(self, addr: str | BLEDevice, with_response: bool = False, notify: bool = False,
+                 concat: bool = False, on_disconnect: Callable[[], None] | None = None) -> None:
         self.addr = addr
-        self.client: BleakClient | None = None
-
-    async def __aenter__(self):
-        self.client = BleakClient(self.addr, timeout=12.0)
-        await self.client.__aenter__()
-        # RX is optional; subscribe if present
+        self.on_disconnect = on_disconnect  # called when the link drops
+        self.client: BleakClient = None  # type: ignore[assignment]  # set by __aenter__
+        self.response = with_response  # ask for a GATT ACK on every write
+        self.notify = notify           # subscribe to RX (costs a CCCD write each way)
+        self._subscribed = False
+        self.concat = concat           # firmware parses several frames in one write
+        self._static_primed = False    # powered on and in static mode on this link
+        # Reused frame buffers: each write patches the value bytes in place
+        self._rgb_buf = bytearray(pkt_rgb(0, 0, 0))
+        self._w_buf = bytearray(pkt_white(0))
+
+    async def __aenter__(self) -> QHM:
+        bleak = _bleak()
+        self.client = bleak.BleakClient(self.addr, timeout=12.0,
+                                        disconnected_callback=self._disconnected)
         try:
-            await self.client.start_notify(CHAR_RX, lambda *_: None)
+            await self.client.__aenter__()
         except Exception:
-            pass
+            if not isinstance(self.addr, bleak.BLEDevice):
+                raise
+            # Stale cached device (e.g. the address rotated): scan and retry
+            forget_device(self.addr.address)
+            self.client = bleak.BleakClient(self.addr.address, timeout=12.0,
+                                            disconnected_callback=self._disconnected)
+            await self.client.__aenter__()
+        # Pick the write type once from what the TX characteristic offers
+        # (acknowledged only if asked for, or if that is all it supports)
+        char = self.client.services.get_characteristic(CHAR_TX)
+        if char is not None:
+            props = char.properties
+            if "write-without-response" not in props:
+                self.response = True
+            elif "write" not in props:
+                self.response = False
+        # RX is optional and nothing reads it; subscribe only for firmwares
+        # that refuse writes without it
+        if self.notify:
+            try:
+                await self.client.start_notify(CHAR_RX, lambda *_: None)
+                self._subscribed = True
+            except Exception:
+                pass
         return self
 
-    async def __aexit__(self, *exc):
-        try:
-            if self.client:
+    def _disconnected(self, client: BleakClient) -> None:
+        self._static_primed = False
+        if self.on_disconnect is not None:
+            self.on_disconnect()
+
+    async def __aexit__(self, exc_type: type[BaseException] | None, exc: BaseException | None,
+                        tb: types.TracebackType | None) -> None:
+        if self._subscribed:
+            self._subscribed = False
+            try:
                 await self.client.stop_notify(CHAR_RX)
-        except Exception:
-            pass
+            except Exception:
+                pass
+        self._static_primed = False
         if self.client:
-            return await self.client.__aexit__(*exc)
-
-    async def ensure_static(self):
-        # Power on + enter static color mode, then tiny pause so next 0x56 lands cleanly
-        await write(self.client, PKT_ON, True)
-        await write(self.client, PKT_STATIC, True)
-        await asyncio.sleep(0.03)
+            await self.client.disconnect()
+
+    async def ensure_static(self) -> None:
+        # Power on + enter static color mode, once per connection: later
+        # color changes go straight out. No settle delay: the writes reach
+        # the controller in order, and with --with-response the ACK for
+        # PKT_STATIC already means it has been processed.
+        if self._static_primed:
+            return
+        await write(self.client, PKT_ON, self.response)
+        await write(self.client, PKT_STATIC, self.response)
+        self._static_primed = True
+
+    async def _send_static(self, frame: bytes | bytearray) -> None:
+        # A static color/white frame, priming static mode first if needed.
+        # With concat, the prime rides in the same ATT write as the frame
+        # (14 bytes, within the 20 the minimum ATT MTU of 23 allows).
+        if not self._static_primed and self.concat:
+            await write(self.client, PKT_ON + PKT_STATIC + frame, self.response)
+            self._static_primed = True
+            return
+        await self.ensure_static()
+        await write(self.client, frame, self.response)
+
+    async def power(self, on: bool) -> None:
+        await write(self.client, PKT_ON if on else PKT_OFF, self.response)
+        if not on:
+            self._static_primed = False
+
+    async def set_rgb(self, r: int, g: int, b: int, order: str = "RGB") -> None:
+        r, g, b = apply_order(r, g, b, order)
+        if (r | g | b) & ~0xFF:  # any channel outside 0..255 (negatives included)
+            r, g, b = (max(0, min(255, v)) for v in (r, g, b))
+        buf = self._rgb_buf
+        buf[1] = r; buf[2] = g; buf[3] = b
+        await self._send_static(buf)
+
+    async def set_rgb_stream(self, frames: Iterable[Sequence[int]], fps: float = 30,
+                             flush_every: int = 8, order: str = "RGB") -> None:
+        # Play (r, g, b) frames at a fixed rate. Writes are fired without
+        # waiting on each one; every flush_every-th frame waits for all in
+        # flight, so a slow link throttles playback instead of queueing.
+        # Frames are fresh bytes: the shared buffer would change under
+        # writes that have not gone out yet.
+        i, j, k = order_perm(order)
+        await self.ensure_static()
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / fps
+        due = loop.time()
+        in_flight: list[asyncio.Future[None]] = []
+        for n, f in enumerate(frames, 1):
+            in_flight.append(asyncio.ensure_future(
+                write(self.client, pkt_rgb(f[i], f[j], f[k]), self.response)))
+            if n % flush_every == 0:
+                await asyncio.gather(*in_flight)
+                in_flight.clear()
+            due += interval
+            await asyncio.sleep(max(0.0, due - loop.time()))
+        await asyncio.gather(*in_flight)
+
+    async def set_white(self, level: int) -> None:
+        if level & ~0xFF:
+            level = max(0, min(255, level))
+        self._w_buf[4] = level
+        await self._send_static(self._w_buf)
+
+    async def set_mode(self, mode: int, speed: int = 0x80) -> None:
+        # BB <mode> <speed> 44  (smaller speed = faster)
+        self._static_primed = False  # leaves static mode
+        await write(self.client, bytes([0xBB, mode & 0xFF, speed & 0xFF, 0x44]), self.response)
 
-    async def power(self, on: bool):
-        await write(self.client, PKT_ON if on else PKT_OFF, True)
+async def dispatch(qhm: QHM, args: argparse.Namespace,
+                   frames: list[list[int]] | None = None) -> None:
+    if args.cmd == "on":
+        await qhm.power(True)
 
-    async def set_rgb(self, r: int, g: int, b: int, order="RGB"):
-        r, g, b = (max(0, min(255, v)) for v in apply_order(r, g, b, order))
-        await self.ensure_static()
-        await write(self.client, pkt_rgb(r, g, b), True)
+    elif args.cmd == "off":
+        await qhm.power(False)
 
-    async def set_white(self, level: int):
-        level = max(0, min(255, level))
-        await self.ensure_static()
-        await write(self.client, pkt_white(level), True)
+    elif args.cmd == "rgb":
+        await qhm.set_rgb(args.r, args.g, args.b, order=args.order)
 
-    async def set_mode(self, mode: int, speed: int = 0x80):
-        # BB <mode> <speed> 44  (smaller speed = faster)
-        await write(self.client, bytes([0xBB, mode & 0xFF, speed & 0xFF, 0x44]), True)
+    elif args.cmd == "hex":
+        r, g, b = parse_hex(args.hex, order=args.order)
+        if args.gamma:
+            r, g, b = _SRGB_LUT[r], _SRGB_LUT[g], _SRGB_LUT[b]
+        await qhm.set_rgb(r, g, b, order=args.order)
 
-async def cmd(args):
-    addr, label = await find_device(args.addr)
-    print("Connecting to", label)
-    async with QHM(addr) as qhm:
-        if args.cmd == "on":
-            await qhm.power(True)
+    elif args.cmd == "white":
+        await qhm.set_white(args.white)
 
-        elif args.cmd == "off":
-            await qhm.power(False)
+    elif args.cmd == "seq":
+        await qhm.set_rgb_stream(frames or (), fps=args.fps)
 
-        elif args.cmd == "rgb":
-            await qhm.set_rgb(args.r, args.g, args.b, order=args.order)
+    elif args.cmd == "mode":
+        await qhm.set_mode(args.mode, args.speed)
 
-        elif args.cmd == "hex":
-            r, g, b = parse_hex(args.hex, order=args.order)
-            if args.gamma:
-                r, g, b = map(srgb_to_linear_byte, (r, g, b))
-            await qhm.set_rgb(r, g, b, order=args.order)
+async def cmd(args: argparse.Namespace) -> None:
+    if args.cmd == "seq":
+        frames = load_seq(args.file, order=args.order, gamma=args.gamma)  # fail before connecting
+    else:
+        frames = None
+    addr, label = await find_device(args.addr)
+    print("Connecting to", label)
+    async with QHM(addr, with_response=args.with_response, notify=args.notify,
+                   concat=args.concat) as qhm:
+        await dispatch(qhm, args, frames)
 
-        elif args.cmd == "white":
-            await qhm.set_white(args.white)
+# ---------------------------
+# Daemon: keep one connection open and take commands over a Unix socket
+# ---------------------------
+SOCK_PATH = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), "qhm.sock")
 
-        elif args.cmd == "mode":
-            await qhm.set_mode(args.mode, args.speed)
+# Not forwarded: daemon is the server
+_LOCAL_ONLY = ("daemon",)
 
-def build_parser():
-    p = argparse.ArgumentParser()
+async def serve(args: argparse.Namespace) -> None:
+    addr, label = await find_device(args.addr)
+    print("Connecting to", label)
+    target = addr.upper() if isinstance(addr, str) else addr.address.upper()
+    parser = build_parser()
+    busy = asyncio.Lock()  # one command on the link at a time
+    lost = asyncio.Event()  # set when the BLE link drops
+    async with QHM(addr, with_response=args.with_response, notify=args.notify,
+                   concat=args.concat, on_disconnect=lost.set) as qhm:
+
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            try:
+                req = parser.parse_args(shlex.split((await reader.readline()).decode()))
+                if req.addr and req.addr.upper() != target:
+                    reply = "other"  # meant for a different light; caller goes direct
+                elif lost.is_set() or not qhm.client.is_connected:
+                    reply = "gone"   # link dropped; caller goes direct
+                else:
+                    frames = None
+                    if req.cmd == "seq":
+                        frames = load_seq(req.file, order=req.order, gamma=req.gamma)
+                    async with busy:
+                        await dispatch(qhm, req, frames)
+                    reply = "ok"
+            except SystemExit:
+                reply = "error: bad command"
+            except Exception as e:
+                reply = f"error: {type(e).__name__}: {e}"
+            writer.write((reply + "\n").encode())
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_unix_server(handle, path=SOCK_PATH)
+        print("Listening on", SOCK_PATH)
+        try:
+            # Serve until the link drops, then close the socket so callers
+            # connect directly instead of talking to a dead daemon
+            async with server:
+                await lost.wait()
+            print("Link lost; daemon exiting")
+        finally:
+            try:
+                os.unlink(SOCK_PATH)
+            except OSError:
+                pass
+
+def via_daemon(argv: list[str], timeout: float | None = 15.0) -> bool:
+    # Hand one command line to a running daemon; False when there is none
+    # (or it drives another light, or lost its link) so the caller connects
+    # directly instead.
+    if not hasattr(socket, "AF_UNIX"):
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(15.0)
+            s.connect(SOCK_PATH)
+            s.settimeout(timeout)
+            s.sendall((shlex.join(argv) + "\n").encode())
+            reply = s.makefile().readline().strip()
+    except TimeoutError:
+        # The daemon holds the link and may still run the command, so a
+        # direct connect now would race it
+        raise SystemExit("error: daemon did not answer (it may still be running the command)")
+    except OSError:
+        return False
+    if reply in ("other", "gone"):
+        return False
+    if reply != "ok":
+        raise SystemExit(reply or "error: daemon closed the connection")
+    return True
+
+def _positive_float(s: str) -> float:
+    # --fps: 0 would divide by zero and negatives/inf silently drop pacing
+    try:
+        v = float(s)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a number: {s}") from None
+    if not 0 < v < float("inf"):
+        raise argparse.ArgumentTypeError(f"must be a positive number, got {s}")
+    return v
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="qhm")  # not "-c" under the launcher above
     p.add_argument("--addr", help="BLE address/UUID (use this for your QHM device)")
+    p.add_argument("--with-response", action="store_true",
+                   help="Wait for a GATT ACK on every write (for firmwares that need it)")
+    p.add_argument("--notify", action="store_true",
+                   help="Subscribe to RX notifications (for firmwares that need it)")
+    p.add_argument("--concat", action="store_true",
+                   help="Send power-on + static mode + color as one write "
+                        "(only for firmwares that accept packed frames)")
 
     sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("daemon", help=f"Stay connected and take commands on {SOCK_PATH}")
     sub.add_parser("on")
     sub.add_parser("off")
 
@@ -174,6 +480,13 @@ def build_parser():
     phex.add_argument("--gamma", action="store_true",
                       help="Apply sRGB→linear gamma (off by default).")
 
+    pseq = sub.add_parser("seq", help="Play a file of 6-hex colors, one per line")
+    pseq.add_argument("file")
+    pseq.add_argument("--order", default="RGB")
+    pseq.add_argument("--gamma", action="store_true",
+                      help="Apply sRGB→linear gamma (off by default).")
+    pseq.add_argument("--fps", type=_positive_float, default=30, help="Frames per second")
+
     pw = sub.add_parser("white", help="Set static white channel (RGB disabled)")
     pw.add_argument("white", type=int, help="0..255")
 
@@ -184,9 +497,21 @@ def build_parser():
 
     return p
 
-def main():
+def main() -> None:
+    argv = sys.argv[1:]
+    args = build_parser().parse_args(argv)
+    timeout: float | None = 15.0
+    if args.cmd == "seq":
+        # The daemon opens the file itself, so send it an absolute path;
+        # playback runs as long as the file does, so wait it out
+        i = argv.index(args.file, argv.index("seq") + 1)
+        argv = argv[:i] + [os.path.abspath(args.file)] + argv[i + 1:]
+        timeout = None
+    if args.cmd not in _LOCAL_ONLY and via_daemon(argv, timeout):
+        return
     try:
-        asyncio.run(cmd(build_parser().parse_args()))
+        run = uvloop.run if HAVE_UVLOOP else asyncio.run
+        run(serve(args) if args.cmd == "daemon" else cmd(args))
     except KeyboardInterrupt:
         print("\nInterrupted.", file=sys.stderr)
 
@@ -1,10 +1,28 @@
 # scan_ble.py
-import asyncio
+import asyncio, argparse
 from bleak import BleakScanner
 
-async def main():
-    devices = await BleakScanner.discover(timeout=6.0)
-    for d in devices:
-        print(d.name, d.address)
+async def main(timeout: float, limit: int):
+    # Print each device as it first advertises instead of after the full window
+    seen = set()
+    done = asyncio.Event()
 
-asyncio.run(main())
+    def on_adv(d, adv):
+        if d.address in seen:
+            return
+        seen.add(d.address)
+        print(d.name or adv.local_name, d.address, flush=True)
+        if limit and len(seen) >= limit:
+            done.set()
+
+    async with BleakScanner(detection_callback=on_adv):
+        try:
+            await asyncio.wait_for(done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+p = argparse.ArgumentParser()
+p.add_argument("--timeout", type=float, default=6.0, help="Seconds to scan (default 6)")
+p.add_argument("-n", type=int, default=0, help="Stop after N unique devices")
+args = p.parse_args()
+asyncio.run(main(args.timeout, args.n))